@@ -4,9 +4,18 @@ import subprocess
 import json
 import time
 import shutil
+import argparse
+import threading
+import uuid
+import functools
+import collections
+import re
+import math
+import tempfile
 from enum import Enum
 from pathlib import Path
 from datetime import datetime, timezone, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QLabel, QPushButton, QFileDialog, 
@@ -14,7 +23,7 @@ from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QFrame, QSplitter, QMessageBox, QProgressBar, QCheckBox, QScrollArea)
 from PyQt6.QtCore import Qt, QThread, pyqtSignal, QUrl, QSize, QMimeData
 from PyQt6.QtGui import QPixmap, QDragEnterEvent, QDropEvent, QColor, QFont, QImage, QDesktopServices
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFont, ImageChops, ImageStat
 
 VERSION = "v1.3"
 
@@ -31,6 +40,16 @@ def get_ffmpeg_path():
         return "ffmpeg"
     return None
 
+@functools.lru_cache(maxsize=None)
+def get_ffmpeg_major_version(ffmpeg):
+    """解析 ffmpeg -version 的主版本号，git 构建等无法识别的版本返回 None"""
+    try:
+        out = subprocess.check_output([ffmpeg, '-version'], stderr=subprocess.DEVNULL, encoding='utf-8', errors='replace')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    m = re.match(r"ffmpeg version n?(\d+)\.", out)
+    return int(m.group(1)) if m else None
+
 def get_ffprobe_path():
     local_ffprobe = os.path.join(os.getcwd(), "ffprobe.exe")
     if os.path.exists(local_ffprobe):
@@ -47,6 +66,348 @@ class WatermarkPosition(Enum):
     BOTTOM_RIGHT = "右下"
     CENTER = "居中"
 
+class WatermarkLayout(Enum):
+    SINGLE = "单个"
+    CORNERS = "四角"
+    TILED = "平铺"
+
+# --- 自适应帧率：低分辨率预分析 ---
+
+# 预分析时每帧缩放到的尺寸 (灰度)，越小越快
+ANALYSIS_SIZE = (64, 36)
+# 与上一保留帧的平均差异 (0~1) 超过该值时保留当前帧
+ADAPTIVE_MOTION_THRESHOLD = 0.02
+# 相邻两帧差异超过该值视为场景切换，强制保留
+SCENE_CHANGE_THRESHOLD = 0.25
+# 画面静止时的最低帧率，保证单帧停留时间不会过长
+ADAPTIVE_MIN_FPS = 2
+# 设定帧数上限时试探阈值的递增倍率，越接近 1 结果越贴近上限 (参照帧相同的阈值共用比较，开销有限)
+ADAPTIVE_THRESHOLD_STEP = 1.15
+
+def iter_analysis_frames(input_path, fps):
+    """以目标帧率解码低分辨率灰度帧，逐帧产出 PIL 图像"""
+    ffmpeg = get_ffmpeg_path()
+    if not ffmpeg:
+        return
+
+    w, h = ANALYSIS_SIZE
+    cmd = [
+        ffmpeg, '-v', 'error',
+        '-i', input_path,
+        '-an',
+        '-vf', f"fps={fps},scale={w}:{h},format=gray",
+        '-f', 'rawvideo', '-pix_fmt', 'gray', '-'
+    ]
+    startupinfo = None
+    if os.name == 'nt':
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, startupinfo=startupinfo)
+    frame_size = w * h
+    try:
+        while True:
+            data = process.stdout.read(frame_size)
+            if len(data) < frame_size:
+                break
+            yield Image.frombytes('L', (w, h), data)
+    finally:
+        process.stdout.close()
+        process.wait()
+
+def frame_difference(a, b):
+    """两帧灰度图的平均绝对差异，归一化到 0~1"""
+    return ImageStat.Stat(ImageChops.difference(a, b)).mean[0] / 255.0
+
+def select_adaptive_frames(frames, fps, thresholds=(ADAPTIVE_MOTION_THRESHOLD,),
+                           scene_threshold=SCENE_CHANGE_THRESHOLD, min_fps=ADAPTIVE_MIN_FPS):
+    """单遍扫描帧序列，同时为多个阈值挑选保留帧，返回 (总帧数, {阈值: 保留帧序号列表})
+
+    与“上一保留帧”比较而不是累加相邻差异，这样噪点不会被累积成运动；
+    场景切换帧和最后一帧总是保留，静止画面至少按 min_fps 保留一帧。
+    frames 可以是生成器：内存中只保留上一帧和各阈值当前的参照帧，
+    相邻帧差异每帧只计算一次，参照帧相同的阈值共用同一次比较。
+    """
+    max_gap = max(1, int(round(fps / float(min_fps))))
+    keeps = {t: [] for t in thresholds}
+    refs = {}  # 参照帧序号 -> 图像
+    prev = None
+    total = 0
+    for i, frame in enumerate(frames):
+        total += 1
+        if prev is None:
+            for keep in keeps.values():
+                keep.append(0)
+            refs = {0: frame}
+            prev = frame
+            continue
+
+        scene_cut = frame_difference(prev, frame) >= scene_threshold
+        diffs = {}
+        for t, keep in keeps.items():
+            last = keep[-1]
+            if scene_cut or i - last >= max_gap:
+                keep.append(i)
+                continue
+            if last not in diffs:
+                diffs[last] = frame_difference(refs[last], frame)
+            if diffs[last] >= t:
+                keep.append(i)
+
+        refs = {keep[-1]: refs.get(keep[-1], frame) for keep in keeps.values()}
+        prev = frame
+
+    # 最后一帧必须保留：WebP 的最后一帧只有一帧的停留时间，
+    # 否则结尾静止的片段 (如片尾定格) 会从时间轴上被截掉
+    for keep in keeps.values():
+        if total and keep[-1] != total - 1:
+            keep.append(total - 1)
+    return total, keeps
+
+def plan_adaptive_frames(frames, fps, frame_budget=0):
+    """在帧数预算内挑选保留帧，返回 (保留帧序号列表, 总帧数)
+
+    frame_budget <= 0 表示不限制，直接使用默认阈值；
+    否则在一次扫描中同时试探一组按固定倍率递增的阈值，取不超过预算的最低阈值 (即保留尽可能多的动态细节)。
+    场景切换与最低帧率是硬性约束，预算过小时结果仍可能超出预算，由调用方提示用户。
+    """
+    thresholds = [ADAPTIVE_MOTION_THRESHOLD]
+    if frame_budget > 0:
+        while thresholds[-1] < 1.0:
+            thresholds.append(min(1.0, thresholds[-1] * ADAPTIVE_THRESHOLD_STEP))
+
+    total, keeps = select_adaptive_frames(frames, fps, thresholds)
+    for t in thresholds:
+        if frame_budget <= 0 or len(keeps[t]) <= frame_budget:
+            return keeps[t], total
+    return keeps[thresholds[-1]], total
+
+def build_select_expr(keep):
+    """把保留帧序号编码为 select 滤镜表达式
+
+    连续帧合并为区间，再按区间起点组织成平衡的 if(lt(n,..),..,..) 二叉树：
+    ffmpeg 的 if() 只计算命中的分支，每帧只需 O(log 区间数) 次比较，
+    而不是把所有区间用 + 串起来逐个计算。
+    """
+    ranges = []
+    for n in keep:
+        if ranges and n == ranges[-1][1] + 1:
+            ranges[-1][1] = n
+        else:
+            ranges.append([n, n])
+
+    def build(lo, hi):
+        if hi - lo == 1:
+            a, b = ranges[lo]
+            return f"eq(n,{a})" if a == b else f"between(n,{a},{b})"
+        mid = (lo + hi) // 2
+        return f"if(lt(n,{ranges[mid][0]}),{build(lo, mid)},{build(mid, hi)})"
+
+    return build(0, len(ranges)) if ranges else "0"
+
+# --- 水印渲染 (与界面无关，供 GUI 和服务模式共用) ---
+
+# 水印与画面边缘的距离
+WATERMARK_MARGIN = 20
+
+@functools.lru_cache(maxsize=64)
+def render_text_sprite(text, font_path, color, target_width, max_height, opacity):
+    """渲染紧贴文字边界的透明文字图块
+
+    结果按参数缓存，批量处理同尺寸视频时无需重复搜索字号。
+    返回的图像是共享的缓存对象，调用方不能修改。
+    """
+    probe = ImageDraw.Draw(Image.new('RGBA', (1, 1)))
+
+    # 自适应字体大小算法
+    font_size = 10
+    try:
+        font = ImageFont.truetype(font_path, font_size)
+    except:
+        font = ImageFont.load_default()
+        
+    # 逐步增大字体直到宽度接近目标宽度
+    while True:
+        bbox = probe.textbbox((0, 0), text, font=font)
+        text_width = bbox[2] - bbox[0]
+        
+        if text_width >= target_width or font_size > max_height:
+            break
+        font_size += 2
+        try:
+            font = ImageFont.truetype(font_path, font_size)
+        except:
+            break
+    
+    # 获取最终文本尺寸
+    bbox = probe.textbbox((0, 0), text, font=font)
+    w = max(1, bbox[2] - bbox[0])
+    h = max(1, bbox[3] - bbox[1])
+
+    # 绘制文本 (解析颜色 + Alpha)
+    c = QColor(color)
+    fill_color = (c.red(), c.green(), c.blue(), opacity)
+
+    sprite = Image.new('RGBA', (w, h), (0, 0, 0, 0))
+    ImageDraw.Draw(sprite).text((-bbox[0], -bbox[1]), text, font=font, fill=fill_color)
+    return sprite
+
+@functools.lru_cache(maxsize=32)
+def load_logo_sprite(logo_path, mtime, box, opacity):
+    """把 Logo 图片等比缩放到 box (宽, 高) 以内并应用透明度
+
+    按 (文件, 修改时间, 目标尺寸, 透明度) 缓存，同尺寸视频批量转换时只重采样一次；
+    mtime 参与缓存键，文件被替换后会自动重新加载。
+    返回的图像是共享的缓存对象，调用方不能修改。
+    """
+    # 多帧图片 (动画 WebP/PNG) convert 后仍持有文件句柄，必须显式关闭
+    with Image.open(logo_path) as src:
+        logo = src.convert('RGBA')
+    scale = min(box[0] / logo.width, box[1] / logo.height)
+    size = (max(1, round(logo.width * scale)), max(1, round(logo.height * scale)))
+    sprite = logo.resize(size, Image.LANCZOS)
+    if opacity < 255:
+        alpha = sprite.getchannel('A').point(lambda a: a * opacity // 255)
+        sprite.putalpha(alpha)
+    return sprite
+
+@functools.lru_cache(maxsize=32)
+def compose_watermark_mark(target_width, max_height, text, font_path, color, opacity, logo_path=None, logo_mtime=None):
+    """把 Logo 与文字横向拼成一个宽度不超过 target_width 的水印图块，两者都没有时返回 None
+
+    结果按参数缓存 (logo_mtime 参与缓存键)，返回的图像是共享的缓存对象，调用方不能修改。
+    """
+    if not logo_path:
+        return render_text_sprite(text, font_path, color, target_width, max_height, opacity) if text else None
+    if not text:
+        return load_logo_sprite(logo_path, logo_mtime, (target_width, max_height), opacity)
+
+    # Logo 与文字等高、最多占一半宽度；文字按扣除 Logo 和间距后的剩余宽度重新排版
+    text_sprite = render_text_sprite(text, font_path, color, target_width, max_height, opacity)
+    logo_sprite = load_logo_sprite(logo_path, logo_mtime, (target_width // 2, text_sprite.height), opacity)
+    gap = max(4, text_sprite.height // 3)
+    text_width = max(1, target_width - logo_sprite.width - gap)
+    text_sprite = render_text_sprite(text, font_path, color, text_width, max_height, opacity)
+    logo_sprite = load_logo_sprite(logo_path, logo_mtime, (target_width // 2, text_sprite.height), opacity)
+    gap = max(4, text_sprite.height // 3)
+
+    w = logo_sprite.width + gap + text_sprite.width
+    h = max(logo_sprite.height, text_sprite.height)
+    mark = Image.new('RGBA', (w, h), (0, 0, 0, 0))
+    mark.alpha_composite(logo_sprite, (0, (h - logo_sprite.height) // 2))
+    mark.alpha_composite(text_sprite, (logo_sprite.width + gap, (h - text_sprite.height) // 2))
+
+    # 字号按步长递增，文字可能略超出剩余宽度，此时整体等比缩小 (结果已缓存，批量时只缩放一次)
+    if w > target_width or h > max_height:
+        scale = min(target_width / w, max_height / h)
+        mark = mark.resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.LANCZOS)
+    return mark
+
+def layout_positions(layout, position, base_width, base_height, w, h, margin=WATERMARK_MARGIN):
+    """计算水印图块的左上角坐标列表"""
+    if layout == WatermarkLayout.TILED:
+        # 交错平铺：奇数行错开半个间距，边缘超出画面的部分会被裁掉
+        step_x = w + max(w // 2, margin * 2)
+        step_y = h * 3
+        points = []
+        for row, y in enumerate(range(margin, base_height, step_y)):
+            offset = step_x // 2 if row % 2 else 0
+            for x in range(margin - offset, base_width, step_x):
+                points.append((x, y))
+        return points
+
+    corners = {
+        WatermarkPosition.TOP_LEFT: (margin, margin),
+        WatermarkPosition.TOP_RIGHT: (base_width - w - margin, margin),
+        WatermarkPosition.BOTTOM_LEFT: (margin, base_height - h - margin),
+        WatermarkPosition.BOTTOM_RIGHT: (base_width - w - margin, base_height - h - margin),
+    }
+    if layout == WatermarkLayout.CORNERS:
+        return list(corners.values())
+    if position == WatermarkPosition.CENTER:
+        return [((base_width - w) // 2, (base_height - h) // 2)]
+    return [corners.get(position, (0, 0))]
+
+def paste_sprite(layer, sprite, x, y):
+    """alpha_composite 不接受负坐标，先裁掉超出画面的部分"""
+    sx, sy = max(0, -x), max(0, -y)
+    right = min(sprite.width, layer.width - x)
+    bottom = min(sprite.height, layer.height - y)
+    if right <= sx or bottom <= sy:
+        return
+    layer.alpha_composite(sprite, (x + sx, y + sy), (sx, sy, right, bottom))
+
+def render_watermark_layer(base_width, base_height, text, font_path, color="#FFFFFF",
+                           size_percent=20, opacity=200, position=WatermarkPosition.BOTTOM_RIGHT,
+                           logo_path=None, layout=WatermarkLayout.SINGLE):
+    """生成一张和视频等大的透明图，并在上面绘制水印
+
+    所有摆放位置 (包括平铺) 都合成在这一张图上，转换时只需要一个 overlay 滤镜。
+    """
+    layer = Image.new('RGBA', (base_width, base_height), (0, 0, 0, 0))
+
+    target_width = max(1, int(base_width * (size_percent / 100.0)))
+    max_height = base_height
+    if layout == WatermarkLayout.CORNERS:
+        # 四角各放一个，每个限制在四分之一画面内，避免相互重叠
+        target_width = min(target_width, max(1, (base_width - 3 * WATERMARK_MARGIN) // 2))
+        max_height = max(1, (base_height - 3 * WATERMARK_MARGIN) // 2)
+
+    logo_mtime = None
+    if logo_path:
+        try:
+            logo_mtime = os.path.getmtime(logo_path)
+        except OSError:
+            logo_path = None
+    try:
+        mark = compose_watermark_mark(target_width, max_height, text, font_path, color, opacity, logo_path, logo_mtime)
+    except OSError:
+        # Logo 不是有效图片时忽略 Logo，与字体加载失败时的处理一致
+        mark = compose_watermark_mark(target_width, max_height, text, font_path, color, opacity)
+    if mark is None: return layer
+
+    for x, y in layout_positions(layout, position, base_width, base_height, mark.width, mark.height):
+        paste_sprite(layer, mark, x, y)
+    return layer
+
+def probe_video_size(video_path):
+    """使用 ffprobe 获取视频分辨率，返回 (width, height)"""
+    startupinfo = None
+    if os.name == 'nt':
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+    cmd_probe = [get_ffprobe_path(), '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=width,height', '-of', 'json', video_path]
+    # 同样添加 encoding='utf-8', errors='replace' 增加健壮性
+    info = subprocess.check_output(
+        cmd_probe, 
+        startupinfo=startupinfo,
+        encoding='utf-8',
+        errors='replace'
+    )
+    data = json.loads(info)
+    return int(data['streams'][0]['width']), int(data['streams'][0]['height'])
+
+def probe_video_duration(video_path):
+    """使用 ffprobe 获取视频时长 (秒)，无法获取时返回 None"""
+    startupinfo = None
+    if os.name == 'nt':
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+    cmd_probe = [get_ffprobe_path(), '-v', 'error', '-show_entries', 'format=duration', '-of', 'json', video_path]
+    try:
+        info = subprocess.check_output(
+            cmd_probe, 
+            startupinfo=startupinfo,
+            encoding='utf-8',
+            errors='replace'
+        )
+        duration = float(json.loads(info)['format']['duration'])
+    except (OSError, subprocess.CalledProcessError, ValueError, KeyError, TypeError):
+        return None
+    return duration if duration > 0 else None
+
 # --- 工作线程：执行耗时的FFmpeg任务 ---
 
 class ConvertWorker(QThread):
@@ -54,15 +415,28 @@ class ConvertWorker(QThread):
     finished = pyqtSignal(str) # 成功返回路径
     error = pyqtSignal(str)
     log = pyqtSignal(str)
+    frames_saved = pyqtSignal(int, int, bool) # 自适应帧率: (保留帧数, 固定帧率下的帧数, 是否满足帧数上限)
 
-    def __init__(self, input_path, output_path, watermark_img_path, position_code, fps, scale_width):
+    def __init__(self, input_path, output_path, watermark_img_path, fps, scale_width,
+                 adaptive_fps=False, frame_budget=0):
         super().__init__()
         self.input_path = input_path
         self.output_path = output_path
         self.watermark_img_path = watermark_img_path
-        self.position_code = position_code
         self.fps = fps
         self.scale_width = scale_width # -1 for keep original, or specific width
+        self.adaptive_fps = adaptive_fps
+        self.frame_budget = frame_budget # 0 表示不限制
+
+    def _report_analysis_progress(self, frames, expected, span):
+        """透传预分析帧，同时按已读帧数 / 预计帧数报告 0~span 的进度"""
+        last_value = 0
+        for i, frame in enumerate(frames):
+            value = int(span * min(1.0, (i + 1) / expected))
+            if value > last_value:
+                last_value = value
+                self.progress.emit(value)
+            yield frame
 
     def run(self):
         ffmpeg = get_ffmpeg_path()
@@ -70,37 +444,77 @@ class ConvertWorker(QThread):
             self.error.emit("未找到 FFmpeg，请确保已安装并配置环境变量。")
             return
 
+        # 时长用于计算真实进度，获取失败时只报告开始和结束
+        duration = probe_video_duration(self.input_path) if get_ffprobe_path() else None
+        # 自适应模式下预分析占 0~20%，编码占 20~99%
+        encode_start = 20 if self.adaptive_fps else 0
+
+        # 固定帧率与自适应帧率都用 fps 滤镜抽帧 (而不是输出端的 -r)，
+        # 这样预分析统计的帧数与固定帧率输出的帧数完全一致，节省帧数的统计才准确
+        source = f"[0:v]fps={self.fps}[sel];[sel]"
+        if self.adaptive_fps:
+            self.progress.emit(0)
+            frames = iter_analysis_frames(self.input_path, self.fps)
+            if duration:
+                frames = self._report_analysis_progress(frames, duration * self.fps, encode_start)
+            keep, total = plan_adaptive_frames(frames, self.fps, self.frame_budget)
+            if not total:
+                self.error.emit("帧率分析失败，请检查源文件是否损坏。")
+                return
+            self.log.emit(f"自适应帧率: 保留 {len(keep)}/{total} 帧，节省 {total - len(keep)} 帧")
+            budget_met = self.frame_budget <= 0 or len(keep) <= self.frame_budget
+            if not budget_met:
+                self.log.emit(f"自适应帧率: 场景切换与最低帧率要求的帧数超过上限 {self.frame_budget}")
+            self.frames_saved.emit(len(keep), total, budget_met)
+            # 与预分析使用同样的 fps 滤镜，保证帧序号一一对应
+            source = f"[0:v]fps={self.fps},select='{build_select_expr(keep)}'[sel];[sel]"
+            self.progress.emit(encode_start)
+
         # 构建滤镜复杂指令
         # 1. 缩放视频 (如果需要)
         # 2. 叠加水印
         
-        # 计算 overlay 坐标
-        overlay_cmd = ""
-        if self.position_code == WatermarkPosition.TOP_LEFT:
-            overlay_cmd = "overlay=10:10"
-        elif self.position_code == WatermarkPosition.TOP_RIGHT:
-            overlay_cmd = "overlay=W-w-10:10"
-        elif self.position_code == WatermarkPosition.BOTTOM_LEFT:
-            overlay_cmd = "overlay=10:H-h-10"
-        elif self.position_code == WatermarkPosition.BOTTOM_RIGHT:
-            overlay_cmd = "overlay=W-w-10:H-h-10"
-        elif self.position_code == WatermarkPosition.CENTER:
-            overlay_cmd = "overlay=(W-w)/2:(H-h)/2"
+        # 水印图与输出画面等大，所有摆放位置 (含平铺) 已合成在同一张图上，
+        # 因此只需一个 overlay 贴在左上角，与预览效果完全一致
+        overlay_cmd = "overlay=0:0"
 
         # 如果需要调整视频尺寸
         scale_filter = ""
         if self.scale_width > 0:
-            scale_filter = f"[0:v]scale={self.scale_width}:-1[scaled];[scaled][1:v]{overlay_cmd}"
+            scale_filter = f"{source}scale={self.scale_width}:-1[scaled];[scaled][1:v]{overlay_cmd}"
+        else:
+            scale_filter = f"{source}[1:v]{overlay_cmd}"
+
+        script_path = None
+        if self.adaptive_fps:
+            # select 表达式可能很长，写入脚本文件以避免超出命令行长度限制；
+            # 文件名唯一，转换结束后在 finally 中删除
+            fd, script_path = tempfile.mkstemp(prefix="adaptive_filter_", suffix=".txt",
+                                               dir=os.path.dirname(os.path.abspath(self.watermark_img_path)))
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(scale_filter)
+            # ffmpeg 7 起 -filter_complex_script 已弃用，改用 -/filter_complex 从文件读取；
+            # 旧版本或无法识别版本号时仍使用旧参数 (新版本只会打印弃用警告)
+            major = get_ffmpeg_major_version(ffmpeg)
+            if major is not None and major >= 7:
+                filter_args = ['-/filter_complex', script_path]
+            else:
+                filter_args = ['-filter_complex_script', script_path]
+            # 可变帧率输出：保留原始时间戳，WebP 中每帧的停留时间随之变化
+            rate_args = ['-fps_mode', 'vfr']
         else:
-            scale_filter = f"[0:v][1:v]{overlay_cmd}"
+            filter_args = ['-filter_complex', scale_filter]
+            rate_args = []
 
         # 命令构建
         cmd = [
             ffmpeg, '-y',
+            # 把机器可读的进度 (out_time_us=...) 输出到 stderr，用于计算真实进度
+            '-nostats', '-progress', 'pipe:2',
             '-i', self.input_path,
             '-i', self.watermark_img_path,
-            '-filter_complex', scale_filter,
-            '-r', str(self.fps),
+            *filter_args,
+            *rate_args,
             '-loop', '0',
             '-c:v', 'libwebp',
             '-lossless', '0',
@@ -129,17 +543,21 @@ class ConvertWorker(QThread):
                 startupinfo=startupinfo
             )
             
-            # 简单的进度模拟
-            while True:
-                if process.poll() is not None:
-                    break
-                # 此时 readline 会使用 utf-8 读取，遇到乱码字符会用 ? 替换，不会抛出异常
-                line = process.stderr.readline()
-                if line:
-                    # print(line.strip()) # 调试用
-                    pass
-                self.progress.emit(50) # 模拟进度
-                time.sleep(0.1)
+            # 按已编码的时间点 / 总时长计算进度
+            # 此时 readline 会使用 utf-8 读取，遇到乱码字符会用 ? 替换，不会抛出异常
+            last_value = encode_start
+            for line in process.stderr:
+                if not duration or not line.startswith('out_time_us='):
+                    continue
+                try:
+                    out_time = int(line.split('=', 1)[1]) / 1000000.0
+                except ValueError:
+                    continue # 开头可能是 N/A
+                value = encode_start + int((99 - encode_start) * min(1.0, out_time / duration))
+                if value > last_value:
+                    last_value = value
+                    self.progress.emit(value)
+            process.wait()
             
             if process.returncode == 0:
                 self.progress.emit(100)
@@ -149,6 +567,12 @@ class ConvertWorker(QThread):
                 
         except Exception as e:
             self.error.emit(str(e))
+        finally:
+            if script_path:
+                try:
+                    os.remove(script_path)
+                except OSError:
+                    pass
 
 
 # --- 自定义控件：支持拖拽的区域 ---
@@ -209,6 +633,7 @@ class MainWindow(QMainWindow):
         self.preview_frame_pil = None # 保存原始第一帧PIL对象
         self.font_path = "msyh.ttc" 
         self.text_color = "#FFFFFF"
+        self.logo_path = None
         self.temp_dir = Path("temp_convert")
         self.temp_dir.mkdir(exist_ok=True)
         
@@ -261,6 +686,17 @@ class MainWindow(QMainWindow):
         h_font.addWidget(self.btn_color)
         settings_layout.addLayout(h_font)
 
+        # Logo 图片 (可与文字同时使用)
+        h_logo = QHBoxLayout()
+        self.btn_logo = QPushButton("选择 Logo 图片")
+        self.btn_logo.clicked.connect(self.choose_logo)
+        self.btn_clear_logo = QPushButton("清除")
+        self.btn_clear_logo.setEnabled(False)
+        self.btn_clear_logo.clicked.connect(self.clear_logo)
+        h_logo.addWidget(self.btn_logo)
+        h_logo.addWidget(self.btn_clear_logo)
+        settings_layout.addLayout(h_logo)
+
         # 位置
         h_pos = QHBoxLayout()
         h_pos.addWidget(QLabel("位置:"))
@@ -271,6 +707,17 @@ class MainWindow(QMainWindow):
         h_pos.addWidget(self.combo_pos)
         settings_layout.addLayout(h_pos)
 
+        # 布局
+        h_layout = QHBoxLayout()
+        h_layout.addWidget(QLabel("布局:"))
+        self.combo_layout = QComboBox()
+        for layout in WatermarkLayout:
+            self.combo_layout.addItem(layout.value, layout)
+        self.combo_layout.setToolTip("单个: 按上方位置放置一个\n四角: 四个角各放一个\n平铺: 交错铺满整个画面")
+        self.combo_layout.currentIndexChanged.connect(lambda: self.combo_pos.setEnabled(self.combo_layout.currentData() == WatermarkLayout.SINGLE))
+        h_layout.addWidget(self.combo_layout)
+        settings_layout.addLayout(h_layout)
+
         # 大小 (相对比例)
         h_size = QHBoxLayout()
         h_size.addWidget(QLabel("大小比例:"))
@@ -352,6 +799,18 @@ class MainWindow(QMainWindow):
         h_fps.addWidget(self.combo_fps)
         out_layout.addLayout(h_fps)
 
+        # 自适应帧率
+        h_adaptive = QHBoxLayout()
+        self.check_adaptive_fps = QCheckBox("自适应帧率")
+        self.check_adaptive_fps.setToolTip("按画面变化保留帧：运动剧烈处保持上方 FPS，静止处自动抽帧并延长停留时间")
+        self.input_frame_budget = QLineEdit()
+        self.input_frame_budget.setPlaceholderText("帧数上限 (留空不限)")
+        self.input_frame_budget.setEnabled(False)
+        self.check_adaptive_fps.toggled.connect(self.input_frame_budget.setEnabled)
+        h_adaptive.addWidget(self.check_adaptive_fps)
+        h_adaptive.addWidget(self.input_frame_budget)
+        out_layout.addLayout(h_adaptive)
+
         left_layout.addWidget(out_group)
 
         # 4. 转换按钮和状态
@@ -424,6 +883,18 @@ class MainWindow(QMainWindow):
             self.font_path = file_path
             self.btn_font.setText(os.path.basename(file_path))
 
+    def choose_logo(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "选择 Logo 图片", "", "Images (*.png *.webp *.jpg *.jpeg *.bmp)")
+        if file_path:
+            self.logo_path = file_path
+            self.btn_logo.setText(os.path.basename(file_path))
+            self.btn_clear_logo.setEnabled(True)
+
+    def clear_logo(self):
+        self.logo_path = None
+        self.btn_logo.setText("选择 Logo 图片")
+        self.btn_clear_logo.setEnabled(False)
+
     def choose_color(self):
         color = QColorDialog.getColor()
         if color.isValid():
@@ -452,17 +923,9 @@ class MainWindow(QMainWindow):
         
         try:
             # 获取分辨率
-            cmd_probe = [get_ffprobe_path(), '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=width,height', '-of', 'json', video_path]
-            # 同样添加 encoding='utf-8', errors='replace' 增加健壮性
-            info = subprocess.check_output(
-                cmd_probe, 
-                startupinfo=self._get_startup_info(),
-                encoding='utf-8',
-                errors='replace'
-            )
-            data = json.loads(info)
-            self.video_info['width'] = int(data['streams'][0]['width'])
-            self.video_info['height'] = int(data['streams'][0]['height'])
+            width, height = probe_video_size(video_path)
+            self.video_info['width'] = width
+            self.video_info['height'] = height
 
             # 获取第一帧图片数据 (PNG格式)
             cmd = [ffmpeg, '-i', video_path, '-vframes', '1', '-f', 'image2pipe', '-vcodec', 'png', '-']
@@ -488,62 +951,17 @@ class MainWindow(QMainWindow):
 
     def generate_watermark_layer(self, base_width, base_height):
         """生成一张和视频等大的透明图，并在上面绘制水印"""
-        layer = Image.new('RGBA', (base_width, base_height), (0, 0, 0, 0))
-        draw = ImageDraw.Draw(layer)
-        
-        text = self.input_text.text()
-        if not text: return layer
-
-        # 自适应字体大小算法
-        target_width = base_width * (self.slider_size.value() / 100.0)
-        
-        font_size = 10
-        try:
-            font = ImageFont.truetype(self.font_path, font_size)
-        except:
-            font = ImageFont.load_default()
-            
-        # 逐步增大字体直到宽度接近目标宽度
-        while True:
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            
-            if text_width >= target_width or font_size > base_height:
-                break
-            font_size += 2
-            try:
-                font = ImageFont.truetype(self.font_path, font_size)
-            except:
-                break
-        
-        # 获取最终文本尺寸
-        bbox = draw.textbbox((0, 0), text, font=font)
-        w = bbox[2] - bbox[0]
-        h = bbox[3] - bbox[1]
-
-        # 计算位置
-        margin = 20
-        x, y = 0, 0
-        pos = self.combo_pos.currentData()
-        
-        if pos == WatermarkPosition.TOP_LEFT:
-            x, y = margin, margin
-        elif pos == WatermarkPosition.TOP_RIGHT:
-            x, y = base_width - w - margin, margin
-        elif pos == WatermarkPosition.BOTTOM_LEFT:
-            x, y = margin, base_height - h - margin
-        elif pos == WatermarkPosition.BOTTOM_RIGHT:
-            x, y = base_width - w - margin, base_height - h - margin
-        elif pos == WatermarkPosition.CENTER:
-            x, y = (base_width - w) // 2, (base_height - h) // 2
-
-        # 绘制文本 (解析颜色 + Alpha)
-        c = QColor(self.text_color)
-        fill_color = (c.red(), c.green(), c.blue(), self.slider_opacity.value())
-        
-        draw.text((x, y), text, font=font, fill=fill_color)
-        return layer
+        return render_watermark_layer(
+            base_width, base_height,
+            text=self.input_text.text(),
+            font_path=self.font_path,
+            color=self.text_color,
+            size_percent=self.slider_size.value(),
+            opacity=self.slider_opacity.value(),
+            position=self.combo_pos.currentData(),
+            logo_path=self.logo_path,
+            layout=self.combo_layout.currentData()
+        )
 
     def trigger_preview(self):
         if self.preview_frame_pil is None:
@@ -644,16 +1062,25 @@ class MainWindow(QMainWindow):
         out_name = f"{new_stem}.webp"
         out_path = out_dir / out_name
 
+        # 帧数上限，非法输入视为不限制
+        try:
+            frame_budget = max(0, int(self.input_frame_budget.text().strip()))
+        except ValueError:
+            frame_budget = 0
+
         # 3. 启动线程
+        self.frames_saved_msg = ""
         self.worker = ConvertWorker(
             input_path=str(p),
             output_path=str(out_path),
             watermark_img_path=str(temp_wm_path),
-            position_code=self.combo_pos.currentData(),
             fps=int(self.combo_fps.currentText()),
-            scale_width=-1
+            scale_width=-1,
+            adaptive_fps=self.check_adaptive_fps.isChecked(),
+            frame_budget=frame_budget
         )
         self.worker.progress.connect(self.progress_bar.setValue)
+        self.worker.frames_saved.connect(self.on_frames_saved)
         self.worker.finished.connect(self.on_convert_finished)
         self.worker.error.connect(self.on_convert_error)
         self.worker.start()
@@ -664,7 +1091,7 @@ class MainWindow(QMainWindow):
         self.last_output_path = out_path
         self.btn_open_folder.setEnabled(True)
         
-        QMessageBox.information(self, "成功", f"转换完成！\n文件已保存至: {out_path}")
+        QMessageBox.information(self, "成功", f"转换完成！\n文件已保存至: {out_path}{self.frames_saved_msg}")
         
         # 显示结果预览
         self.result_label.setText("")
@@ -680,6 +1107,13 @@ class MainWindow(QMainWindow):
         except:
             pass
 
+    def on_frames_saved(self, kept, total, budget_met):
+        saved = total - kept
+        ratio = saved * 100 // total if total else 0
+        self.frames_saved_msg = f"\n自适应帧率: 共 {kept} 帧，比固定帧率 ({total} 帧) 节省 {saved} 帧 ({ratio}%)"
+        if not budget_met:
+            self.frames_saved_msg += "\n注意: 为保留场景切换和最低帧率，帧数未能控制在设定的上限内"
+
     def on_convert_error(self, msg):
         self.btn_convert.setEnabled(True)
         QMessageBox.critical(self, "错误", f"转换出错: {msg}")
@@ -689,7 +1123,513 @@ class MainWindow(QMainWindow):
             folder = os.path.dirname(self.last_output_path)
             QDesktopServices.openUrl(QUrl.fromLocalFile(folder))
 
+# --- 服务模式：本地 HTTP 转换服务 + 持久化任务队列 ---
+
+class QueueFullError(Exception):
+    """排队任务数已达上限，调用方应稍后重试"""
+
+class OutputInUseError(Exception):
+    """已有排队中或运行中的任务写入同一个输出文件"""
+
+def _output_key(path):
+    """统一输出路径的写法，用于判断两个任务是否会写同一个文件"""
+    return os.path.normcase(os.path.abspath(path))
+
+def _get_str(payload, key, default=None):
+    """取字符串参数，类型不对时报 ValueError (避免 list 等值在后续调用中抛出 TypeError)"""
+    value = payload.get(key, default)
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"{key} 必须是字符串")
+    return value
+
+def _get_int(payload, key, default, lo, hi):
+    """取整数参数并限制在 [lo, hi] 内
+
+    拒绝布尔值 (JSON 的 true 在 Python 中是 int 的子类) 和 Infinity/1e400 这类非有限数，
+    否则 int() 会抛出 OverflowError 导致处理线程直接断开连接。
+    """
+    value = payload.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{key} 必须是数字")
+    if isinstance(value, float) and not math.isfinite(value):
+        raise ValueError(f"{key} 必须是有限数字")
+    return min(hi, max(lo, int(value)))
+
+def _parse_enum_name(enum_cls, value, label):
+    """枚举既可以用名称 (BOTTOM_RIGHT)，也可以用界面上的中文 (右下)，统一返回名称"""
+    if value in enum_cls.__members__:
+        return value
+    try:
+        return enum_cls(value).name
+    except ValueError:
+        raise ValueError(f"未知的{label}: {value}")
+
+def parse_job_settings(payload):
+    """校验 HTTP 提交的任务参数，缺省值与界面默认设置一致"""
+    if not isinstance(payload, dict):
+        raise ValueError("请求体必须是 JSON 对象")
+
+    input_path = _get_str(payload, 'input_path')
+    if not input_path or not os.path.isfile(input_path):
+        raise ValueError("input_path 不存在")
+
+    output_path = _get_str(payload, 'output_path')
+    if not output_path:
+        p = Path(input_path)
+        output_path = str(p.parent / f"{p.stem}.webp")
+    if not os.path.isdir(os.path.dirname(os.path.abspath(output_path))):
+        raise ValueError("output_path 所在目录不存在")
+
+    logo_path = _get_str(payload, 'logo_path')
+    if logo_path and not os.path.isfile(logo_path):
+        raise ValueError("logo_path 不存在")
+
+    position = _parse_enum_name(WatermarkPosition, _get_str(payload, 'position', WatermarkPosition.BOTTOM_RIGHT.name), "水印位置")
+    layout = _parse_enum_name(WatermarkLayout, _get_str(payload, 'layout', WatermarkLayout.SINGLE.name), "水印布局")
+
+    # 必须是 JSON 布尔值，字符串 "false" 不能被当作 True
+    adaptive_fps = payload.get('adaptive_fps', False)
+    if not isinstance(adaptive_fps, bool):
+        raise ValueError("adaptive_fps 必须是 true 或 false")
+
+    settings = {
+        'input_path': input_path,
+        'output_path': output_path,
+        'text': _get_str(payload, 'text', "这里是水印"),
+        'font_path': _get_str(payload, 'font_path', "msyh.ttc"),
+        'color': _get_str(payload, 'color', "#FFFFFF"),
+        'position': position,
+        'logo_path': logo_path or None,
+        'layout': layout,
+        'adaptive_fps': adaptive_fps,
+    }
+    # 取值范围与界面控件一致；scale_width <= 0 表示保持原尺寸
+    scale_width = _get_int(payload, 'scale_width', -1, -1, 4096)
+    settings.update({
+        'size': _get_int(payload, 'size', 20, 5, 80),
+        'opacity': _get_int(payload, 'opacity', 200, 10, 255),
+        'fps': _get_int(payload, 'fps', 15, 1, 60),
+        'scale_width': scale_width if scale_width > 0 else -1,
+        'frame_budget': _get_int(payload, 'frame_budget', 0, 0, 100000),
+    })
+    return settings
+
+class JobQueue:
+    """持久化任务队列
+
+    每个任务保存为 jobs_dir 下的一个 JSON 文件，服务重启后自动加载；
+    重启前处于“运行中”的任务会被重新排队。
+    已结束的任务最多保留 max_finished 个、finished_ttl 秒，超出后连同文件一起删除，
+    因此长期运行时内存、GET /jobs 和启动加载的开销都有上限。
+    """
+
+    def __init__(self, jobs_dir, max_pending=32, max_finished=200, finished_ttl=7 * 24 * 3600):
+        self.jobs_dir = Path(jobs_dir)
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir = self.jobs_dir / "tmp"
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self.finished_ttl = finished_ttl
+        self._cond = threading.Condition()
+        self._jobs = {}
+        self._queued = collections.deque()    # 排队中的任务 ID，按提交顺序
+        self._finished = collections.deque()  # 已结束的任务 ID，按结束顺序
+        self._outputs = {}  # 排队中/运行中任务的输出路径 -> 任务 ID，防止两个任务同时写同一个文件
+        self._seq = 0
+        self._closed = False
+        self._load()
+
+    @staticmethod
+    def _check_record(job, path):
+        """校验任务文件的结构，不合法时抛出 ValueError"""
+        if not isinstance(job, dict):
+            raise ValueError("任务记录必须是 JSON 对象")
+        if job.get('id') != path.stem:
+            raise ValueError("任务 ID 与文件名不一致")
+        if job.get('status') not in ('queued', 'running', 'done', 'failed'):
+            raise ValueError("未知的任务状态")
+        if isinstance(job.get('seq'), bool) or not isinstance(job.get('seq'), int):
+            raise ValueError("seq 必须是整数")
+        if isinstance(job.get('created'), bool) or not isinstance(job.get('created'), (int, float)):
+            raise ValueError("created 必须是数字")
+        settings = job.get('settings')
+        if not isinstance(settings, dict) or not isinstance(settings.get('output_path'), str):
+            raise ValueError("settings 缺少 output_path")
+
+    def _load(self):
+        # 上次异常退出时遗留的临时文件：tmp 目录和 _save 写到一半的 *.tmp
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        for path in self.jobs_dir.glob("*.tmp"):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+        for path in self.jobs_dir.glob("*.json"):
+            try:
+                job = json.loads(path.read_text(encoding='utf-8'))
+                self._check_record(job, path)
+            except OSError:
+                continue
+            except ValueError:
+                # 结构不对的文件改名隔离，既不阻止服务启动，也保留下来便于排查
+                try:
+                    path.replace(path.with_name(path.name + ".bad"))
+                except OSError:
+                    pass
+                continue
+            if job['status'] == 'running':
+                job['status'] = 'queued'
+                job['progress'] = 0
+                self._save(job)
+            self._jobs[job['id']] = job
+            self._seq = max(self._seq, job['seq'])
+
+        jobs = sorted(self._jobs.values(), key=lambda j: j['seq'])
+        self._queued.extend(j['id'] for j in jobs if j['status'] == 'queued')
+        for j in jobs:
+            if j['status'] == 'queued':
+                self._outputs.setdefault(_output_key(j['settings']['output_path']), j['id'])
+        finished = [j for j in jobs if j['status'] in ('done', 'failed')]
+        finished.sort(key=lambda j: j.get('finished', j['created']))
+        self._finished.extend(j['id'] for j in finished)
+        self._prune()
+
+    def _save(self, job):
+        path = self.jobs_dir / f"{job['id']}.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(job, ensure_ascii=False), encoding='utf-8')
+        # 原子替换，避免写到一半时崩溃留下损坏的任务文件
+        os.replace(tmp, path)
+
+    def _release_output(self, job):
+        key = _output_key(job['settings']['output_path'])
+        if self._outputs.get(key) == job['id']:
+            del self._outputs[key]
+
+    def _remove(self, job_id):
+        del self._jobs[job_id]
+        try:
+            (self.jobs_dir / f"{job_id}.json").unlink()
+        except OSError:
+            pass
+
+    def _prune(self):
+        """按数量和保留时间清理已结束的任务 (最早结束的在队首)"""
+        deadline = time.time() - self.finished_ttl
+        while self._finished:
+            oldest = self._jobs[self._finished[0]]
+            if len(self._finished) <= self.max_finished and oldest.get('finished', oldest['created']) >= deadline:
+                break
+            self._remove(self._finished.popleft())
+
+    def submit(self, settings):
+        with self._cond:
+            if len(self._queued) >= self.max_pending:
+                raise QueueFullError()
+            output_key = _output_key(settings['output_path'])
+            if output_key in self._outputs:
+                raise OutputInUseError(self._outputs[output_key])
+            self._seq += 1
+            job = {
+                'id': uuid.uuid4().hex,
+                'seq': self._seq,
+                'status': 'queued',
+                'progress': 0,
+                'settings': settings,
+                'output_path': None,
+                'error': None,
+                'created': time.time(),
+            }
+            self._jobs[job['id']] = job
+            self._queued.append(job['id'])
+            self._outputs[output_key] = job['id']
+            self._save(job)
+            self._cond.notify()
+            return dict(job)
+
+    def get(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self):
+        with self._cond:
+            self._prune()
+            return [dict(job) for job in sorted(self._jobs.values(), key=lambda j: j['seq'])]
+
+    def delete(self, job_id):
+        """删除排队中或已结束的任务，返回被删除的任务；任务不存在时返回 None
+
+        运行中的任务不能删除，抛出 RuntimeError。
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job['status'] == 'running':
+                raise RuntimeError("任务正在运行，无法删除")
+            if job['status'] == 'queued':
+                self._queued.remove(job_id)
+                self._release_output(job)
+            else:
+                self._finished.remove(job_id)
+            self._remove(job_id)
+            return dict(job)
+
+    def claim(self):
+        """阻塞直到有排队任务，取出最早提交的一个并标记为运行中；队列关闭时返回 None"""
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+                if self._queued:
+                    job = self._jobs[self._queued.popleft()]
+                    job['status'] = 'running'
+                    self._save(job)
+                    return dict(job)
+                self._cond.wait()
+
+    def set_progress(self, job_id, value):
+        # 进度变化频繁，只保存在内存中，不写盘
+        with self._cond:
+            self._jobs[job_id]['progress'] = value
+
+    def finish(self, job_id, **fields):
+        with self._cond:
+            job = self._jobs[job_id]
+            job.update(fields)
+            job['finished'] = time.time()
+            self._save(job)
+            self._release_output(job)
+            self._finished.append(job_id)
+            self._prune()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+class ConvertRequestHandler(BaseHTTPRequestHandler):
+    """HTTP 接口:
+    POST /jobs        提交任务 (JSON)，返回 202；队列已满时返回 503 + Retry-After
+    GET  /jobs        列出所有任务
+    GET  /jobs/<id>   查询任务状态与进度
+    DELETE /jobs/<id> 删除排队中或已结束的任务 (运行中的任务返回 409)
+    """
+
+    MAX_BODY_SIZE = 64 * 1024
+
+    def _send_json(self, code, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        queue = self.server.job_queue
+        parts = [p for p in self.path.split('?')[0].split('/') if p]
+        if parts == ['jobs']:
+            self._send_json(200, {'jobs': queue.list()})
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            job = queue.get(parts[1])
+            if job:
+                self._send_json(200, job)
+            else:
+                self._send_json(404, {'error': "任务不存在"})
+        else:
+            self._send_json(404, {'error': "未知接口"})
+
+    def do_DELETE(self):
+        queue = self.server.job_queue
+        parts = [p for p in self.path.split('?')[0].split('/') if p]
+        if len(parts) != 2 or parts[0] != 'jobs':
+            self._send_json(404, {'error': "未知接口"})
+            return
+        try:
+            job = queue.delete(parts[1])
+        except RuntimeError as e:
+            self._send_json(409, {'error': str(e)})
+            return
+        if job:
+            self._send_json(200, job)
+        else:
+            self._send_json(404, {'error': "任务不存在"})
+
+    def do_POST(self):
+        queue = self.server.job_queue
+        if self.path.split('?')[0].rstrip('/') != '/jobs':
+            self._send_json(404, {'error': "未知接口"})
+            return
+
+        # 先校验 Content-Length 再读取：缺失、非数字或负数都不能交给 rfile.read()，
+        # 否则要么线程异常断开连接，要么 read(-1) 一直阻塞到客户端关闭连接
+        length_header = self.headers.get('Content-Length')
+        if length_header is None:
+            self._send_json(411, {'error': "缺少 Content-Length"})
+            return
+        try:
+            length = int(length_header)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send_json(400, {'error': "Content-Length 无效"})
+            return
+        if length > self.MAX_BODY_SIZE:
+            self._send_json(413, {'error': "请求体过大"})
+            return
+
+        try:
+            payload = json.loads(self.rfile.read(length).decode('utf-8'))
+            settings = parse_job_settings(payload)
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+            return
+
+        try:
+            job = queue.submit(settings)
+        except QueueFullError:
+            self._send_json(503, {'error': "队列已满，请稍后重试"}, headers={'Retry-After': '5'})
+            return
+        except OutputInUseError as e:
+            self._send_json(409, {'error': "已有未完成的任务写入同一个输出文件", 'job_id': str(e)})
+            return
+        self._send_json(202, job, headers={'Location': f"/jobs/{job['id']}"})
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+class ConvertServer:
+    """本地转换服务：HTTP 接口 + 持久化队列 + 固定大小的工作线程池"""
+
+    def __init__(self, jobs_dir, host="127.0.0.1", port=8765, workers=2, max_pending=32,
+                 max_finished=200, finished_ttl=7 * 24 * 3600, quiet=False):
+        self.queue = JobQueue(jobs_dir, max_pending, max_finished, finished_ttl)
+        self.httpd = ThreadingHTTPServer((host, port), ConvertRequestHandler)
+        self.httpd.job_queue = self.queue
+        self.httpd.quiet = quiet
+        self.workers = [threading.Thread(target=self._work_loop, daemon=True) for _ in range(workers)]
+        self._http_thread = None
+
+    @property
+    def address(self):
+        return self.httpd.server_address
+
+    def start(self):
+        """在后台线程中启动服务 (测试与嵌入使用)"""
+        for t in self.workers:
+            t.start()
+        self._http_thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._http_thread.start()
+
+    def serve_forever(self):
+        for t in self.workers:
+            t.start()
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        self.queue.close()
+        if self._http_thread:
+            self.httpd.shutdown()
+        self.httpd.server_close()
+        # 正在运行的任务不等待：重启后会被重新排队
+
+    def _work_loop(self):
+        while True:
+            job = self.queue.claim()
+            if job is None:
+                return
+            self._run_job(job)
+
+    def _run_job(self, job):
+        s = job['settings']
+        job_tmp = self.queue.tmp_dir / job['id']
+        result = {}
+        try:
+            job_tmp.mkdir(parents=True, exist_ok=True)
+            width, height = probe_video_size(s['input_path'])
+            # 水印图按输出尺寸渲染 (与 scale=W:-1 的等比缩放一致)
+            if s['scale_width'] > 0:
+                width, height = s['scale_width'], max(1, round(height * s['scale_width'] / width))
+            layer = render_watermark_layer(
+                width, height,
+                text=s['text'],
+                font_path=s['font_path'],
+                color=s['color'],
+                size_percent=s['size'],
+                opacity=s['opacity'],
+                position=WatermarkPosition[s['position']],
+                # 兼容旧版本保存的任务 (没有这两个字段)
+                logo_path=s.get('logo_path'),
+                layout=WatermarkLayout[s.get('layout', WatermarkLayout.SINGLE.name)]
+            )
+            wm_path = job_tmp / "watermark.png"
+            layer.save(wm_path)
+
+            worker = ConvertWorker(
+                input_path=s['input_path'],
+                output_path=s['output_path'],
+                watermark_img_path=str(wm_path),
+                fps=s['fps'],
+                scale_width=s['scale_width'],
+                adaptive_fps=s['adaptive_fps'],
+                frame_budget=s['frame_budget']
+            )
+            worker.progress.connect(lambda v: self.queue.set_progress(job['id'], v))
+            worker.finished.connect(lambda p: result.update(output_path=p))
+            worker.error.connect(lambda msg: result.update(error=msg))
+            worker.frames_saved.connect(lambda kept, total, budget_met: result.update(
+                frames_kept=kept, frames_total=total, frame_budget_met=budget_met))
+            # 直接在当前工作线程中同步执行，不启动 QThread，也不需要 Qt 事件循环
+            worker.run()
+        except Exception as e:
+            result['error'] = str(e)
+        finally:
+            shutil.rmtree(job_tmp, ignore_errors=True)
+
+        if result.get('error'):
+            self.queue.finish(job['id'], status='failed', **result)
+        else:
+            self.queue.finish(job['id'], status='done', progress=100, **result)
+
+def run_server(argv):
+    parser = argparse.ArgumentParser(description="视频转 WebP 本地转换服务")
+    parser.add_argument('--server', action='store_true')
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=2, help="同时转换的任务数")
+    parser.add_argument('--max-queue', type=int, default=32, help="排队任务上限，超出时返回 503")
+    parser.add_argument('--jobs-dir', default="server_jobs", help="任务持久化目录")
+    parser.add_argument('--keep-finished', type=int, default=200, help="最多保留的已结束任务数")
+    parser.add_argument('--finished-ttl', type=float, default=168, help="已结束任务的保留时间 (小时)")
+    args = parser.parse_args(argv)
+
+    if not get_ffmpeg_path() or not get_ffprobe_path():
+        print("未检测到 FFmpeg 或 FFprobe。")
+        return 1
+
+    server = ConvertServer(args.jobs_dir, args.host, args.port, max(1, args.workers), max(1, args.max_queue),
+                           max(0, args.keep_finished), max(0.0, args.finished_ttl) * 3600)
+    host, port = server.address[:2]
+    print(f"转换服务已启动: http://{host}:{port}/jobs")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
 if __name__ == "__main__":
+    if "--server" in sys.argv:
+        sys.exit(run_server(sys.argv[1:]))
+
     # 高DPI 适配设置
     os.environ["QT_AUTO_SCREEN_SCALE_FACTOR"] = "1"
     QApplication.setHighDpiScaleFactorRoundingPolicy(Qt.HighDpiScaleFactorRoundingPolicy.PassThrough)
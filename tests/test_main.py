@@ -0,0 +1,216 @@
+"""服务模式与自适应帧率的单元测试，不依赖 FFmpeg，全部在 localhost 上运行"""
+import sys
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+import http.client
+from pathlib import Path
+from unittest import mock
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image
+
+import main
+
+
+class TempDirTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.video = os.path.join(self.dir, "a.mp4")
+        Path(self.video).touch()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class ParseJobSettingsTest(TempDirTestCase):
+    def test_defaults(self):
+        s = main.parse_job_settings({'input_path': self.video})
+        self.assertEqual(s['output_path'], os.path.join(self.dir, "a.webp"))
+        self.assertEqual(s['position'], 'BOTTOM_RIGHT')
+        self.assertEqual(s['layout'], 'SINGLE')
+        self.assertEqual(s['fps'], 15)
+        self.assertEqual(s['scale_width'], -1)
+        self.assertFalse(s['adaptive_fps'])
+
+    def test_enum_accepts_name_or_label(self):
+        s = main.parse_job_settings({'input_path': self.video, 'position': "左上", 'layout': 'TILED'})
+        self.assertEqual((s['position'], s['layout']), ('TOP_LEFT', 'TILED'))
+
+    def test_clamps_numbers(self):
+        s = main.parse_job_settings({'input_path': self.video, 'fps': 999, 'scale_width': 99999, 'size': 1})
+        self.assertEqual((s['fps'], s['scale_width'], s['size']), (60, 4096, 5))
+
+    def test_rejects_bad_input(self):
+        bad = [
+            [],
+            {},
+            {'input_path': ["a"]},
+            {'input_path': os.path.join(self.dir, "missing.mp4")},
+            {'input_path': self.video, 'output_path': os.path.join(self.dir, "no", "x.webp")},
+            {'input_path': self.video, 'position': [1]},
+            {'input_path': self.video, 'position': "中间"},
+            {'input_path': self.video, 'layout': {}},
+            {'input_path': self.video, 'adaptive_fps': "false"},
+            {'input_path': self.video, 'fps': True},
+            {'input_path': self.video, 'fps': "15"},
+            {'input_path': self.video, 'size': float('inf')},
+            {'input_path': self.video, 'logo_path': os.path.join(self.dir, "logo.png")},
+        ]
+        for payload in bad:
+            with self.subTest(payload=payload):
+                with self.assertRaises(ValueError):
+                    main.parse_job_settings(payload)
+
+
+class JobQueueTest(TempDirTestCase):
+    def settings(self, name="a.webp"):
+        return {'output_path': os.path.join(self.dir, name)}
+
+    def test_persists_across_restart(self):
+        jobs_dir = os.path.join(self.dir, "jobs")
+        job = main.JobQueue(jobs_dir).submit(self.settings())
+        reloaded = main.JobQueue(jobs_dir)
+        self.assertEqual(reloaded.get(job['id'])['settings'], job['settings'])
+        self.assertEqual(reloaded.claim()['id'], job['id'])
+
+    def test_running_job_is_requeued_on_restart(self):
+        jobs_dir = os.path.join(self.dir, "jobs")
+        queue = main.JobQueue(jobs_dir)
+        job = queue.submit(self.settings())
+        queue.claim()
+        self.assertEqual(queue.get(job['id'])['status'], 'running')
+        self.assertEqual(main.JobQueue(jobs_dir).get(job['id'])['status'], 'queued')
+
+    def test_back_pressure(self):
+        queue = main.JobQueue(os.path.join(self.dir, "jobs"), max_pending=2)
+        queue.submit(self.settings("1.webp"))
+        queue.submit(self.settings("2.webp"))
+        with self.assertRaises(main.QueueFullError):
+            queue.submit(self.settings("3.webp"))
+
+    def test_duplicate_output_rejected_until_finished(self):
+        queue = main.JobQueue(os.path.join(self.dir, "jobs"))
+        job = queue.submit(self.settings())
+        with self.assertRaises(main.OutputInUseError):
+            queue.submit(self.settings())
+        queue.claim()
+        queue.finish(job['id'], status='done')
+        queue.submit(self.settings())
+
+    def test_finished_jobs_are_pruned(self):
+        jobs_dir = os.path.join(self.dir, "jobs")
+        queue = main.JobQueue(jobs_dir, max_finished=1)
+        for name in ("1.webp", "2.webp"):
+            job = queue.submit(self.settings(name))
+            queue.claim()
+            queue.finish(job['id'], status='done')
+        self.assertEqual(len(queue.list()), 1)
+        self.assertEqual(len(list(Path(jobs_dir).glob("*.json"))), 1)
+
+    def test_malformed_files_are_quarantined(self):
+        jobs_dir = Path(self.dir) / "jobs"
+        jobs_dir.mkdir()
+        (jobs_dir / "list.json").write_text("[]", encoding='utf-8')
+        (jobs_dir / "partial.json").write_text('{"id": "partial"}', encoding='utf-8')
+        (jobs_dir / "x.tmp").write_text("{", encoding='utf-8')
+        queue = main.JobQueue(jobs_dir)
+        self.assertEqual(queue.list(), [])
+        self.assertEqual(sorted(p.name for p in jobs_dir.iterdir()), ["list.json.bad", "partial.json.bad"])
+
+
+class ConvertServerTest(TempDirTestCase):
+    def start_server(self, workers=0, max_pending=2):
+        server = main.ConvertServer(os.path.join(self.dir, "jobs"), port=0, workers=workers,
+                                    max_pending=max_pending, quiet=True)
+        server.start()
+        self.addCleanup(server.shutdown)
+        return server
+
+    def request(self, server, method, path, body=None, headers=None):
+        conn = http.client.HTTPConnection(*server.address[:2], timeout=5)
+        self.addCleanup(conn.close)
+        conn.putrequest(method, path)
+        for key, value in (headers or {}).items():
+            conn.putheader(key, value)
+        conn.endheaders(body)
+        resp = conn.getresponse()
+        return resp.status, resp.read()
+
+    def post(self, server, payload):
+        body = json.dumps(payload).encode('utf-8')
+        return self.request(server, 'POST', '/jobs', body, {'Content-Length': str(len(body))})
+
+    def test_submit_poll_and_back_pressure(self):
+        server = self.start_server()
+        status, body = self.post(server, {'input_path': self.video, 'output_path': os.path.join(self.dir, "1.webp")})
+        self.assertEqual(status, 202)
+        job_id = json.loads(body)['id']
+        self.post(server, {'input_path': self.video, 'output_path': os.path.join(self.dir, "2.webp")})
+        status, _ = self.post(server, {'input_path': self.video, 'output_path': os.path.join(self.dir, "3.webp")})
+        self.assertEqual(status, 503)
+
+        status, body = self.request(server, 'GET', f'/jobs/{job_id}')
+        self.assertEqual((status, json.loads(body)['status']), (200, 'queued'))
+        self.assertEqual(self.request(server, 'GET', '/jobs/missing')[0], 404)
+        self.assertEqual(self.request(server, 'DELETE', f'/jobs/{job_id}')[0], 200)
+        self.assertEqual(self.request(server, 'GET', f'/jobs/{job_id}')[0], 404)
+
+    def test_duplicate_output_conflict(self):
+        server = self.start_server()
+        self.assertEqual(self.post(server, {'input_path': self.video})[0], 202)
+        self.assertEqual(self.post(server, {'input_path': self.video})[0], 409)
+
+    def test_invalid_payload(self):
+        server = self.start_server()
+        self.assertEqual(self.post(server, {'input_path': ["a"]})[0], 400)
+        body = ('{"input_path": %s, "size": 1e400}' % json.dumps(self.video)).encode('utf-8')
+        self.assertEqual(self.request(server, 'POST', '/jobs', body, {'Content-Length': str(len(body))})[0], 400)
+
+    def test_content_length_checks(self):
+        server = self.start_server()
+        self.assertEqual(self.request(server, 'POST', '/jobs')[0], 411)
+        self.assertEqual(self.request(server, 'POST', '/jobs', headers={'Content-Length': 'abc'})[0], 400)
+        self.assertEqual(self.request(server, 'POST', '/jobs', headers={'Content-Length': '-1'})[0], 400)
+        size = main.ConvertRequestHandler.MAX_BODY_SIZE + 1
+        self.assertEqual(self.request(server, 'POST', '/jobs', headers={'Content-Length': str(size)})[0], 413)
+
+    def test_worker_records_failure(self):
+        # 不依赖 FFmpeg：分辨率直接给定，转换失败 (未安装或源文件无效) 时任务应标记为 failed
+        with mock.patch.object(main, 'probe_video_size', return_value=(64, 36)):
+            server = self.start_server(workers=1)
+            status, body = self.post(server, {'input_path': self.video})
+            job_id = json.loads(body)['id']
+            for _ in range(100):
+                job = server.queue.get(job_id)
+                if job['status'] in ('done', 'failed'):
+                    break
+                time.sleep(0.1)
+        self.assertEqual(job['status'], 'failed')
+        self.assertTrue(job['error'])
+
+
+class AdaptiveFramesTest(unittest.TestCase):
+    def test_select_adaptive_frames(self):
+        frames = ([Image.new('L', (64, 36), 0)] * 20 +
+                  [Image.new('L', (64, 36), 10 * i) for i in range(1, 6)] +
+                  [Image.new('L', (64, 36), 255)] * 5)
+        total, keeps = main.select_adaptive_frames(iter(frames), fps=10, min_fps=2)
+        keep = keeps[main.ADAPTIVE_MOTION_THRESHOLD]
+        self.assertEqual(total, 30)
+        # 静止段每 5 帧保留一帧，运动段逐帧保留，场景切换帧和最后一帧必须保留
+        self.assertEqual(keep, [0, 5, 10, 15, 20, 21, 22, 23, 24, 25, 29])
+
+    def test_build_select_expr(self):
+        self.assertEqual(main.build_select_expr([0, 1, 2, 5, 9, 10]),
+                         "if(lt(n,5),between(n,0,2),if(lt(n,9),eq(n,5),between(n,9,10)))")
+        self.assertEqual(main.build_select_expr([]), "0")
+
+
+if __name__ == "__main__":
+    unittest.main()